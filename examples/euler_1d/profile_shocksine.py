@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# encoding: utf-8
+r"""
+Profile the Shu-Osher problem (shocksine.py).
+
+By default the run is profiled with pyinstrument
+(https://github.com/joerick/pyinstrument), which samples the call stack at
+regular intervals instead of hooking every Python call the way cProfile does.
+Its overhead is small and does not skew the timings toward Python-heavy
+frames, so time spent in the compiled Riemann solvers and SharpClaw routines
+is reported faithfully.
+
+Usage::
+
+    python profile_shocksine.py
+
+Alternatively, the run can be sampled from outside the interpreter with
+py-spy (https://github.com/benfred/py-spy), which also shows native frames::
+
+    py-spy record --native -o shocksine.svg -- python shocksine.py
+
+For exact call counts and the full call graph, profile with cProfile
+instead; the statistics are saved to ``shocksine.pstats``::
+
+    python profile_shocksine.py cprofile
+
+The file can be browsed with snakeviz or converted to a call graph::
+
+    snakeviz shocksine.pstats
+    gprof2dot -f pstats shocksine.pstats | dot -Tsvg -o shocksine.svg
+"""
+
+import shocksine
+
+
+def profile(**kwargs):
+    r"""
+    Run shocksine with the given setup arguments under pyinstrument and
+    print the resulting call tree.
+    """
+    from pyinstrument import Profiler
+
+    claw = shocksine.setup(**kwargs)
+
+    profiler = Profiler()
+    profiler.start()
+    claw.run()
+    profiler.stop()
+
+    print(profiler.output_text(unicode=True,color=False))
+    return profiler
+
+
+def cprofile(stats_file='shocksine.pstats',**kwargs):
+    r"""
+    Run shocksine with the given setup arguments under cProfile and save the
+    statistics to *stats_file*.
+    """
+    import cProfile
+
+    claw = shocksine.setup(**kwargs)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    claw.run()
+    profiler.disable()
+
+    profiler.dump_stats(stats_file)
+    print("Profile statistics written to %s" % stats_file)
+    return profiler
+
+
+if __name__=="__main__":
+    import sys
+    if 'cprofile' in sys.argv[1:]:
+        cprofile()
+    else:
+        profile()
@@ -40,7 +40,7 @@ def f(y, x, zdown, zup):
 def setup(kernel_language='Fortran', solver_type='classic', use_petsc=False,
           dimensional_split=False, outdir='Sedov_output', output_format='hdf5',
           disable_output=False, num_cells=(64,64,64),
-          tfinal=0.10, num_output_times=10):
+          tfinal=0.10, num_output_times=10, output_options={}):
 
     if use_petsc:
         import clawpack.petclaw as pyclaw
@@ -109,6 +109,7 @@ def setup(kernel_language='Fortran', solver_type='classic', use_petsc=False,
     claw.solution = pyclaw.Solution(state, domain)
     claw.solver = solver
     claw.output_format = output_format
+    claw.output_options = dict(output_options)
     claw.keep_copy = True
     if disable_output:
         claw.output_format = None
@@ -1,3 +1,9 @@
+import os
+import numpy as np
+
+# Layouts of the parallel HDF5 writer, given by its output options
+hdf5_layouts = ({},{'single_file':True},{'single_dataset':True})
+
 def test_sedov_and_hdf():
     """Test HDF I/O on Sedov 3D Euler application"""
 
@@ -14,7 +20,7 @@ def test_sedov_and_hdf():
         import os
         from clawpack.pyclaw.util import check_diff
         from clawpack.pyclaw import Solution
-        
+
         thisdir = os.path.dirname(__file__)
         verify_dir = os.path.join(thisdir,'./Sedov_regression')
 
@@ -40,27 +46,185 @@ def test_sedov_and_hdf():
         else:
             return
 
+    def verify_sedov_petclaw(controller):
+        check_petclaw_hdf(controller.outdir,controller.output_options,
+                          num_frames=2,write_aux=False)
+        return verify_sedov(controller)
+
     from clawpack.pyclaw.util import gen_variants
     tempdir = './_sedov_test_results'
-    classic_tests = gen_variants(Sedov.setup, 
+    classic_tests = gen_variants(Sedov.setup,
                                  verify_sedov, solver_type='classic',
                                  disable_petsc=True,
                                  outdir=tempdir, num_cells=(16, 16, 16),
                                  num_output_times=1)
 
+    # Round trip through the parallel writer, in each of its layouts
+    petclaw_tests = []
+    if parallel_hdf5_available():
+        from clawpack.pyclaw.util import test_app
+        for (i,options) in enumerate(hdf5_layouts):
+            kwargs = {'use_petsc':True, 'solver_type':'classic',
+                      'outdir':os.path.join(tempdir,'petclaw%d' % i),
+                      'num_cells':(16, 16, 16), 'num_output_times':1,
+                      'output_options':options}
+            test = lambda kwargs=kwargs: test_app(Sedov.setup,
+                                                  verify_sedov_petclaw,kwargs)
+            test.description = 'Sedov(use_petsc=True, output_options=%s)' \
+                               % options
+            petclaw_tests.append(test)
+
     import shutil
     from itertools import chain
     try:
-        for test in chain(classic_tests):
+        for test in chain(classic_tests,petclaw_tests):
             yield test
     finally:
+        barrier()
         ERROR_STR= """Error removing %(path)s, %(error)s """
         try:
-            shutil.rmtree(tempdir )
+            if is_rank_0():
+                shutil.rmtree(tempdir )
         except OSError as (errno, strerror):
             print ERROR_STR % {'path' : tempdir, 'error': strerror }
 
 
+def test_petclaw_hdf_layouts():
+    """Write q and aux with the parallel HDF5 writer and read them back"""
+
+    if not parallel_hdf5_available():
+        import nose
+        raise nose.SkipTest
+
+    import shutil
+    tempdir = './_petclaw_hdf_test_results'
+    try:
+        for (i,options) in enumerate(hdf5_layouts):
+            for write_aux in (False,True):
+                path = os.path.join(tempdir,'layout%d_aux%d' % (i,write_aux))
+                test = lambda path=path,options=options,write_aux=write_aux: \
+                    write_and_read_petclaw_hdf(path,options,write_aux)
+                test.description = 'petclaw hdf5 (output_options=%s, ' \
+                                   'write_aux=%s)' % (options,write_aux)
+                yield test
+    finally:
+        barrier()
+        if is_rank_0():
+            shutil.rmtree(tempdir,ignore_errors=True)
+
+
+def write_and_read_petclaw_hdf(path,options,write_aux,num_frames=2):
+    r"""Write *num_frames* frames of a PetClaw solution on an uneven 3D grid
+    with clawpack.petclaw.io.hdf5 and check that pyclaw.io.hdf5.read
+    returns the values that were written."""
+    from clawpack import petclaw
+    from clawpack import pyclaw
+    from clawpack.petclaw.io import hdf5
+
+    x = petclaw.Dimension(0.0, 1.0, 6, name='x')
+    y = petclaw.Dimension(0.0, 1.0, 5, name='y')
+    z = petclaw.Dimension(0.0, 1.0, 4, name='z')
+    domain = petclaw.Domain([x,y,z])
+    state = petclaw.State(domain,2,1)
+    solution = petclaw.Solution(state,domain)
+
+    for frame in range(num_frames):
+        state.t = 0.5*frame
+        state.q = exact_q(state.grid.p_centers,frame)
+        state.aux = exact_aux(state.grid.p_centers)
+        solution.write(frame,path,'hdf5',write_aux=write_aux,
+                       options=dict(options))
+    hdf5.close()
+    barrier()
+
+    check_petclaw_hdf(path,options,num_frames,write_aux)
+    for frame in range(num_frames):
+        sol = pyclaw.Solution()
+        sol.read(frame,path=path,file_format='hdf5',read_aux=write_aux,
+                 options=options)
+        assert sol.t == 0.5*frame
+        # The local and global grids compute cell centers differently
+        centers = sol.state.grid.p_centers
+        assert np.allclose(sol.state.q,exact_q(centers,frame),rtol=1e-13)
+        if write_aux:
+            assert np.allclose(sol.state.aux,exact_aux(centers),rtol=1e-13)
+    barrier()
+
+
+def exact_q(centers,frame):
+    r"""Return q of the round trip test at the given cell *centers*."""
+    (X,Y,Z) = centers
+    return np.array([X + 10*Y + 100*Z + frame, X*Y*Z - frame])
+
+def exact_aux(centers):
+    r"""Return aux of the round trip test at the given cell *centers*."""
+    (X,Y,Z) = centers
+    return np.array([1. + X - Y + Z])
+
+
+def check_petclaw_hdf(path,options,num_frames,write_aux):
+    r"""Check how the datasets written by clawpack.petclaw.io.hdf5 with
+    *options* are stored: in double precision without filters, and, if
+    written once, without fill values."""
+    import h5py
+
+    if options.get('single_file'):
+        filenames = [os.path.join(path,'claw.hdf')]
+    else:
+        filenames = [os.path.join(path,'claw%04d.hdf' % frame)
+                     for frame in range(num_frames)]
+    for filename in filenames:
+        with h5py.File(filename,'r') as f:
+            if options.get('single_dataset'):
+                names = ['q_global','aux_global']
+                group = f
+                assert 'offsets' in f
+                assert f['offsets'].shape == (1,3)
+                assert 'q' not in f['patch1']
+            else:
+                names = ['q','aux']
+                group = f['patch1']
+            assert (names[1] in group) == write_aux
+            for name in names[:1+write_aux]:
+                dset = group[name]
+                assert dset.dtype == np.float64
+                assert dset.compression is None
+                if options.get('single_file'):
+                    assert dset.shape[0] == num_frames
+                else:
+                    plist = dset.id.get_create_plist()
+                    assert plist.get_fill_time() == h5py.h5d.FILL_TIME_NEVER
+            if options.get('single_file'):
+                assert group['t'].shape == (num_frames,)
+
+
+def parallel_hdf5_available():
+    r"""Return whether PetClaw and its parallel HDF5 writer can be used."""
+    try:
+        import petsc4py
+        import clawpack.petclaw.io.hdf5
+    except ImportError:
+        return False
+    return True
+
+def is_rank_0():
+    r"""Return whether this is process 0, or the only process."""
+    try:
+        from petsc4py import PETSc
+    except ImportError:
+        return True
+    return PETSc.COMM_WORLD.getRank() == 0
+
+def barrier():
+    r"""Wait for all processes, so that no file is removed or read before
+    every process is done with it."""
+    try:
+        from petsc4py import PETSc
+    except ImportError:
+        return
+    PETSc.COMM_WORLD.barrier()
+
+
 if __name__=="__main__":
     import nose
     nose.main()
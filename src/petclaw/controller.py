@@ -2,6 +2,8 @@
 Module for PetClaw controller class.
 """
 
+import sys
+
 from clawpack import pyclaw
 
 class Controller(pyclaw.controller.Controller):
@@ -17,6 +19,19 @@ class Controller(pyclaw.controller.Controller):
 
         self.output_format = 'petsc'
 
+    def run(self):
+        status = super(Controller,self).run()
+        if isinstance(self.output_format,str):
+            formats = [self.output_format]
+        else:
+            formats = self.output_format or []
+        # Close files kept open between frames by the parallel HDF5 writer,
+        # if it was used
+        hdf5 = sys.modules.get('clawpack.petclaw.io.hdf5')
+        if 'hdf5' in formats and hasattr(hdf5,'close'):
+            hdf5.close()
+        return status
+
     def is_proc_0(self):
         from petsc4py import PETSc
         rank = PETSc.Comm.getRank(PETSc.COMM_WORLD)
@@ -15,9 +15,14 @@ __all__ = ['ascii.read','ascii.write']
 # Check for HDF 5 support
 try:
     import h5py
-    from clawpack.pyclaw.io import hdf5
+    try:
+        from clawpack.petclaw.io import hdf5
+    except ImportError:
+        # No parallel h5py: fall back to the serial reader and writer
+        logging.debug("No parallel hdf5 support found.")
+        from clawpack.pyclaw.io import hdf5
     __all__ += ['hdf5.read','hdf5.write']
-except:
+except ImportError:
     logging.debug("No hdf5 support found.")
     
 # Check for netcdf support
@@ -0,0 +1,689 @@
+#!/usr/bin/env python
+# encoding: utf-8
+r"""
+Routines for reading and writing a HDF5 output file in parallel
+
+This module writes hdf5 files from all processes at once using the MPI-IO
+driver of h5py:
+    h5py - http://www.h5py.org/
+
+Both h5py and the underlying HDF5 library must be built with parallel (MPI)
+support, and mpi4py must be available.  Each process writes the portion of
+the global arrays that it owns; the writes are collective so that the MPI-IO
+layer can aggregate them into large contiguous requests.
+
+Files written by this module have the same layout as those written by
+:mod:`clawpack.pyclaw.io.hdf5`, which is used to read them back in.
+"""
+
+import os
+import sys
+import atexit
+import logging
+import itertools
+from contextlib import contextmanager
+
+import numpy as np
+
+from clawpack.pyclaw.io.hdf5 import read, patch_attributes
+
+logger = logging.getLogger('pyclaw.io')
+
+try:
+    import h5py
+    from mpi4py import MPI
+except ImportError:
+    raise ImportError("Could not import h5py or mpi4py, please install " +
+        "a parallel (MPI-enabled) build of h5py.  See the doc_string for " +
+        "more information.")
+
+if not h5py.get_config().mpi:
+    raise ImportError("h5py was built without MPI support, parallel HDF5 " +
+        "output is not available.")
+
+
+def _env_stripe_size(default=1 << 20):
+    r"""
+    Return the stripe size given in the environment variable
+    PYCLAW_LUSTRE_STRIPE, or *default* if it is unset or not a positive
+    integer.
+    """
+    value = os.environ.get('PYCLAW_LUSTRE_STRIPE')
+    if value is None:
+        return default
+    try:
+        stripe_size = int(value)
+    except ValueError:
+        stripe_size = 0
+    if stripe_size <= 0:
+        logger.warning("Ignoring invalid PYCLAW_LUSTRE_STRIPE=%r, using a "
+                       "stripe size of %d bytes." % (value,default))
+        return default
+    return stripe_size
+
+# Stripe size of the parallel file system (bytes), 1 MiB unless given in the
+# environment variable PYCLAW_LUSTRE_STRIPE.  File space pages, large objects
+# and default chunk sizes are aligned to it.
+_stripe_size = _env_stripe_size()
+
+# File space page size used for paged aggregation (bytes)
+_page_size = _stripe_size
+
+# Extent of a default chunk along each spatial dimension before it is grown
+# to fill a stripe
+_max_chunk_cells = 64
+
+# Files kept open between frames (single_file output), keyed by file name
+_open_files = {}
+
+# MPI-IO hints: collective buffering with 16 MiB buffers, and files striped
+# like the file system
+_mpi_hints = {'romio_cb_write':'enable',
+              'cb_buffer_size':str(16 << 20),
+              'striping_unit':str(_stripe_size)}
+
+# Registered HDF5 filter id and default options (LZ4, level 5, byte shuffle)
+# of the blosc plugin
+_blosc_filter = 32001
+_blosc_opts = (0,0,0,0,5,1,1)
+
+# Filtered datasets can only be written in parallel by HDF5 >= 1.10.2
+_parallel_filters = h5py.version.hdf5_version_tuple >= (1,10,2)
+
+# The fill time of a dataset can be passed to create_dataset from h5py 3.4;
+# older versions reset it whenever the dataset is chunked
+_fill_time_kwarg = h5py.version.version_tuple >= (3,4)
+
+
+def write(solution,frame,path,file_prefix='claw',write_aux=False,
+                options={},write_p=False):
+    r"""
+    Write out a Solution to a HDF5 file in parallel.
+
+    :Input:
+     - *solution* - (:class:`~pyclaw.solution.Solution`) Pyclaw solution
+       object to input into
+     - *frame* - (int) Frame number
+     - *path* - (string) Root path
+     - *file_prefix* - (string) Prefix for the file name.  ``default = 'claw'``
+     - *write_aux* - (bool) Boolean controlling whether the associated
+       auxiliary array should be written out.  ``default = False``
+     - *options* - (dict) Optional argument dictionary, see
+       `HDF5 Option Table`_
+
+    .. _`HDF5 Option Table`:
+
+    +-----------------+------------------------------------------------------+
+    | Key             | Value                                                |
+    +=================+======================================================+
+    | compression     | (None, string ["gzip" | "lzf" | "blosc"] or int 0-9) |
+    |                 | Dataset compression, ``default = None``.  "gzip" can |
+    |                 | be read by any HDF5 reader.  "lzf" and "blosc" are   |
+    |                 | faster, but the files then need h5py or the filter   |
+    |                 | plugin to be read.  "blosc" (LZ4 with byte shuffle)  |
+    |                 | is used only if the blosc HDF5 plugin is available,  |
+    |                 | otherwise LZF is used.  Parallel compression needs   |
+    |                 | HDF5 1.10.2 or newer; with older versions the data   |
+    |                 | are written uncompressed.                            |
+    +-----------------+------------------------------------------------------+
+    |compression_opts | (None, or special value) Setting for compression     |
+    |                 | filter; see :mod:`pyclaw.io.hdf5`.                   |
+    +-----------------+------------------------------------------------------+
+    | chunks          | (None, True or shape tuple) Chunk shape.  If None,   |
+    |                 | chunks hold all fields and are sized to fill at      |
+    |                 | least one file system stripe where the dataset is    |
+    |                 | large enough.                                        |
+    +-----------------+------------------------------------------------------+
+    | shuffle         | (None/True/False) Enable byte shuffling before       |
+    |                 | compression.  If None, shuffling is enabled when the |
+    |                 | data are compressed.  ``default = None``             |
+    +-----------------+------------------------------------------------------+
+    | fletcher32      | (True/False) Enable Fletcher32 error detection.      |
+    +-----------------+------------------------------------------------------+
+    | dump_dtype      | (string or numpy dtype) Type in which *q* is stored, |
+    |                 | ``default = "f8"``.  "f4" halves the size of the     |
+    |                 | output, e.g. for visualization, but loses precision; |
+    |                 | such output is not suitable for restarting.          |
+    +-----------------+------------------------------------------------------+
+    | aux_scaleoffset | (None or int) If given, *aux* is stored with the     |
+    |                 | lossy HDF5 scale-offset filter, keeping this many    |
+    |                 | decimal digits.  Only suitable for fields with a     |
+    |                 | small dynamic range.  ``default = None``             |
+    +-----------------+------------------------------------------------------+
+    | single_file     | (True/False) Write all frames to one file            |
+    |                 | ``<file_prefix>.hdf``, see below.                    |
+    |                 | ``default = False``                                  |
+    +-----------------+------------------------------------------------------+
+    | single_dataset  | (True/False) Write the data of all patches to one    |
+    |                 | dataset, see below.  Cannot be combined with         |
+    |                 | *single_file*.  ``default = False``                  |
+    +-----------------+------------------------------------------------------+
+
+    With *single_file*, each patch group holds datasets ``q`` (and ``aux``)
+    that are extended by one entry along a leading frame axis for every frame
+    written, and a dataset ``t`` with the time of each frame.  The file is
+    created when frame 0 is written and then kept open for later frames, so
+    that the cost of opening a file is paid once per run.  Call :func:`flush`
+    to write out buffered data, e.g. for checkpointing, and :func:`close` to
+    close the file; the PetClaw controller closes it at the end of a run, and
+    it is closed at the latest when the interpreter exits.  Pass the same
+    option to :func:`read` to read such a file.
+
+    With *single_dataset*, the patch groups only hold attributes.  The data
+    of all patches is written to the root datasets ``q_global`` (and
+    ``aux_global``) of shape ``(num_fields, total number of cells)``, the
+    cells of each patch being numbered in C order.  The root dataset
+    ``offsets`` has a row ``(patch_index, start, stop)`` for each patch,
+    giving the range of cells of that patch.  Writing one large dataset
+    instead of one per patch scales better with collective and compressed
+    I/O.  :func:`read` detects this layout.
+    """
+    option_defaults = {'compression':None,'compression_opts':None,
+                       'chunks':None,'shuffle':None,'fletcher32':False,
+                       'dump_dtype':'f8','aux_scaleoffset':None,
+                       'single_file':False,'single_dataset':False}
+    for (k,v) in option_defaults.items():
+        options[k] = options.get(k,v)
+
+    filter_options = _filter_options(options)
+    aux_filter_options = dict(filter_options)
+    if options['aux_scaleoffset'] is not None and _parallel_filters:
+        aux_filter_options['scaleoffset'] = options['aux_scaleoffset']
+        aux_filter_options['shuffle'] = True
+
+    if options['single_file'] and options['single_dataset']:
+        raise Exception("The single_file and single_dataset options " +
+                        "cannot be combined.")
+
+    if options['single_file']:
+        filename = os.path.join(path,'%s.hdf' % file_prefix)
+        index = int(frame)
+        create = index == 0 or (filename not in _open_files and
+                                not _exists(filename))
+    else:
+        filename = os.path.join(path,'%s%04d.hdf' % (file_prefix,frame))
+        index = None
+        create = True
+
+    with _output_file(filename,create,options['single_file']) as f:
+
+        # Raw data writes, deferred until all metadata has been created
+        writes = []
+
+        if options['single_dataset']:
+            if write_p:
+                num_fields = solution.states[0].mp
+            else:
+                num_fields = solution.num_eqn
+            offsets = _patch_offsets(solution.states)
+            num_cells = int(offsets[-1][2])
+            q_global = _create_dataset(f,'q_global',[num_fields,num_cells],
+                                       dtype=options['dump_dtype'],
+                                       chunks=options['chunks'],
+                                       **filter_options)
+            write_aux = write_aux and solution.num_aux > 0
+            if write_aux:
+                aux_global = _create_dataset(f,'aux_global',
+                                             [solution.num_aux,num_cells],
+                                             dtype='float',
+                                             chunks=options['chunks'],
+                                             **aux_filter_options)
+            dset = f.create_dataset('offsets',offsets.shape,
+                                    dtype=offsets.dtype)
+            writes.append((dset,offsets,None))
+
+        # For each patch, write out attributes
+        for (i,state) in enumerate(solution.states):
+            patch = state.patch
+            group_name = 'patch%s' % patch.patch_index
+            if group_name in f:
+                subgroup = f[group_name]
+            else:
+                # Create group for this patch, with its properties
+                subgroup = f.create_group(group_name)
+                subgroup.attrs.update(patch_attributes(state))
+
+            if index is None:
+                subgroup.attrs['t'] = state.t
+            else:
+                dset = _create_dataset(subgroup,'t',[],index,dtype='float',
+                                       chunks=True)
+                writes.append((dset,np.array([state.t]),
+                               (slice(index,index+1),)))
+
+            if write_p:
+                q = state.p
+            else:
+                q = state.q
+
+            # Block of the patch owned by this process, shared by q and aux
+            ranges = patch._da.getRanges()
+
+            if options['single_dataset']:
+                start = offsets[i][1]
+                shape = patch.num_cells_global
+                writes.append((q_global,
+                               _contiguous(q,state,'q',options['dump_dtype']),
+                               _flat_selection(q_global,start,shape,ranges)))
+                if write_aux:
+                    writes.append((aux_global,
+                                   _contiguous(state.aux,state,'aux','float'),
+                                   _flat_selection(aux_global,start,shape,
+                                                   ranges)))
+                continue
+
+            sel = _selection(ranges,index)
+            globalSize = _global_shape(q.shape[0],patch)
+            dset = _create_dataset(subgroup,'q',globalSize,index,
+                                   dtype=options['dump_dtype'],
+                                   chunks=options['chunks'],**filter_options)
+            writes.append((dset,_contiguous(q,state,'q',options['dump_dtype']),
+                           sel))
+
+            if write_aux and state.num_aux > 0:
+                globalSize = _global_shape(state.num_aux,patch)
+                dset = _create_dataset(subgroup,'aux',globalSize,index,
+                                       dtype='float',chunks=options['chunks'],
+                                       **aux_filter_options)
+                writes.append((dset,_contiguous(state.aux,state,'aux','float'),
+                               sel))
+
+        _write_collective(writes)
+
+
+def _filter_options(options):
+    r"""
+    Return the filter keyword arguments for ``create_dataset`` requested by
+    *options*, falling back to what the installed HDF5 can do.
+    """
+    filter_options = {}
+    for k in ['compression','compression_opts','shuffle','fletcher32']:
+        filter_options[k] = options[k]
+
+    if filter_options['compression'] == 'blosc':
+        if h5py.h5z.filter_avail(_blosc_filter):
+            filter_options['compression'] = _blosc_filter
+            if filter_options['compression_opts'] is None:
+                filter_options['compression_opts'] = _blosc_opts
+            # Blosc shuffles the bytes itself
+            filter_options['shuffle'] = False
+        else:
+            logger.warning("Blosc filter not available, using LZF instead.")
+            filter_options['compression'] = 'lzf'
+            filter_options['compression_opts'] = None
+
+    # Shuffling only pays off in front of a compressor
+    if filter_options['shuffle'] is None:
+        filter_options['shuffle'] = filter_options['compression'] is not None
+
+    if not _parallel_filters:
+        if filter_options['compression'] is not None:
+            logger.warning("HDF5 %s cannot write compressed data in "
+                           "parallel, writing uncompressed data instead."
+                           % h5py.version.hdf5_version)
+        filter_options['compression'] = None
+        filter_options['compression_opts'] = None
+        filter_options['shuffle'] = False
+        filter_options['fletcher32'] = False
+
+    return filter_options
+
+
+def _patch_offsets(states):
+    r"""
+    Return an array with a row ``(patch_index, start, stop)`` for the patch
+    of each of *states*, where cells ``start:stop`` of a global dataset of
+    flattened cells belong to that patch.
+    """
+    offsets = np.empty((len(states),3),dtype='int64')
+    stop = 0
+    for (i,state) in enumerate(states):
+        start = stop
+        stop = start + int(np.prod(state.patch.num_cells_global))
+        offsets[i] = (state.patch.patch_index,start,stop)
+    return offsets
+
+
+def _flat_selection(dset,start,shape,ranges):
+    r"""
+    Return a dataspace of *dset*, a dataset of fields by flattened cells, in
+    which the block owned by this process of a patch of global *shape* is
+    selected, given its ownership *ranges* as returned by ``DA.getRanges()``.
+    The cells of the patch start at *start* and are numbered in C order.
+
+    The cells of the block with fixed indices in all but the last two
+    dimensions form one regular, strided hyperslab; the selection is the
+    union of these.
+    """
+    num_fields = dset.shape[0]
+    shape = list(shape)
+    lo = [r[0] for r in ranges]
+    n = [r[1]-r[0] for r in ranges]
+    strides = [int(np.prod(shape[i+1:])) for i in range(len(shape))]
+
+    space = dset.id.get_space()
+    space.select_none()
+    if 0 in n:
+        return space
+
+    if len(shape) == 1:
+        rows, row_stride = 1, 1
+    else:
+        rows, row_stride = n[-2], strides[-2]
+    num_outer = max(len(shape)-2,0)
+    inner_start = sum(lo[k]*strides[k] for k in range(num_outer,len(shape)))
+    outer = [range(lo[k],lo[k]+n[k]) for k in range(num_outer)]
+    for idx in itertools.product(*outer):
+        first = start + inner_start + sum(i*s for (i,s) in zip(idx,strides))
+        space.select_hyperslab((0,first),(1,rows),stride=(1,row_stride),
+                               block=(num_fields,n[-1]),
+                               op=h5py.h5s.SELECT_OR)
+    return space
+
+
+def _global_shape(num_fields,patch):
+    r"""
+    Return the global shape of an array of *num_fields* fields on *patch*.
+    """
+    return [num_fields] + list(patch.num_cells_global)
+
+
+def _chunk_shape(shape,itemsize,chunks=None):
+    r"""
+    Return the chunk shape for a dataset of global *shape* with elements of
+    *itemsize* bytes.
+
+    Unless *chunks* is given explicitly, each chunk holds all fields of a
+    block of at most ``_max_chunk_cells`` cells in each spatial dimension.
+    The block is then grown, doubling its smallest extent, until the chunk
+    fills at least one file system stripe or covers the whole dataset.  Chunks
+    of a stripe or more are aligned to stripe boundaries (see
+    :func:`_open_file`), so that each chunk starts on a new stripe.
+    """
+    if chunks is not None:
+        return chunks
+    chunk = [shape[0]] + [min(n,_max_chunk_cells) for n in shape[1:]]
+    while np.prod(chunk)*itemsize < _stripe_size:
+        growable = [i for i in range(1,len(chunk)) if chunk[i] < shape[i]]
+        if not growable:
+            break
+        i = min(growable,key=lambda i: chunk[i])
+        chunk[i] = min(2*chunk[i],shape[i])
+    return tuple(chunk)
+
+
+def _exists(filename):
+    r"""
+    Return whether *filename* exists, as seen by process 0.
+
+    All processes get the same answer, so that they agree on whether to
+    create or reopen the file.
+    """
+    comm = MPI.COMM_WORLD
+    exists = None
+    if comm.Get_rank() == 0:
+        exists = os.path.exists(filename)
+    return comm.bcast(exists,root=0)
+
+
+def _selection(ranges,index=None):
+    r"""
+    Return the selection of the block owned by this process in a dataset of
+    fields, given its ownership *ranges* as returned by ``DA.getRanges()``.
+    If *index* is given, the dataset has a leading frame axis and the block
+    of that frame is selected.
+    """
+    sel = (slice(None),) + tuple(slice(lo,hi) for (lo,hi) in ranges)
+    if index is not None:
+        sel = (index,) + sel
+    return sel
+
+
+def _create_dataset(group,name,shape,index=None,**kwargs):
+    r"""
+    Create dataset *name* of the given *shape* in *group*.  Its chunk shape
+    is computed from the *chunks* option by :func:`_chunk_shape`.
+
+    A dataset written once is completely overwritten right after it is
+    created, so it is never initialized with fill values, and unless it is
+    filtered its space is allocated at creation.
+
+    If *index* is given, the dataset instead gets an unlimited leading frame
+    axis; it is created on first use, and extended so that it has an entry
+    for frame *index*.  Must be called by all processes.
+    """
+    kwargs['chunks'] = _chunk_shape(shape,np.dtype(kwargs['dtype']).itemsize,
+                                    kwargs.get('chunks'))
+    if index is None:
+        dcpl = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+        filtered = any(kwargs.get(k) for k in
+                       ('compression','shuffle','fletcher32','scaleoffset'))
+        if not filtered:
+            dcpl.set_alloc_time(h5py.h5d.ALLOC_TIME_EARLY)
+        if _fill_time_kwarg:
+            return group.create_dataset(name,shape,dcpl=dcpl,
+                                        fill_time='never',**kwargs)
+        return _create_unfilled_dataset(group,name,shape,dcpl,**kwargs)
+
+    if name in group:
+        dset = group[name]
+    else:
+        chunks = kwargs.pop('chunks')
+        if chunks is not True:
+            chunks = (1,) + tuple(chunks)
+        dset = group.create_dataset(name,[0]+list(shape),
+                                    maxshape=(None,)+tuple(shape),
+                                    chunks=chunks,**kwargs)
+    if dset.shape[0] <= index:
+        dset.resize(index+1,axis=0)
+    return dset
+
+
+def _create_unfilled_dataset(group,name,shape,dcpl,dtype,chunks=None,
+                             compression=None,compression_opts=None,
+                             shuffle=None,fletcher32=None,scaleoffset=None):
+    r"""
+    Create dataset *name* of the given *shape* in *group* through the
+    low-level API, with fill time never, for versions of h5py whose
+    ``create_dataset`` has no *fill_time* argument.  *dcpl* is completed with
+    the layout and filters in the same way as by ``create_dataset``.
+    """
+    # Integers 0-9 and True are gzip levels, as for create_dataset
+    if compression is True:
+        compression = 4
+    if (isinstance(compression,int) and not isinstance(compression,bool)
+            and 0 <= compression <= 9):
+        (compression,compression_opts) = ('gzip',compression)
+
+    shape = tuple(shape)
+    dtype = np.dtype(dtype)
+    dcpl = h5py.filters.fill_dcpl(dcpl,shape,dtype,chunks,compression,
+                                  compression_opts,shuffle,fletcher32,None,
+                                  scaleoffset,None)
+    dcpl.set_fill_time(h5py.h5d.FILL_TIME_NEVER)
+    dsid = h5py.h5d.create(group.id,name.encode('utf-8'),
+                           h5py.h5t.py_create(dtype,logical=1),
+                           h5py.h5s.create_simple(shape),dcpl=dcpl)
+    return h5py.Dataset(dsid)
+
+
+def flush():
+    r"""
+    Flush the files kept open by single_file output to disk.  Must be called
+    by all processes.
+    """
+    for f in list(_open_files.values()):
+        f.flush()
+
+
+def close():
+    r"""
+    Close the files kept open by single_file output.  Must be called by all
+    processes.
+    """
+    while _open_files:
+        (filename,f) = _open_files.popitem()
+        if f:
+            f.close()
+
+atexit.register(close)
+
+
+@contextmanager
+def _output_file(filename,create=True,keep_open=False):
+    r"""
+    Context manager providing *filename* open for parallel writing.
+
+    The file is closed on exit, unless *keep_open* is True, in which case
+    it is kept in ``_open_files`` and reused by later calls until
+    :func:`close` is called or it is created again.
+    """
+    if not keep_open:
+        f = _open_file(filename,create)
+        try:
+            yield f
+        finally:
+            f.close()
+        return
+
+    f = _open_files.pop(filename,None)
+    if f and create:
+        f.close()
+    if not f or create:
+        f = _open_file(filename,create)
+    _open_files[filename] = f
+    yield f
+
+
+def _open_file(filename,create=True):
+    r"""
+    Create (truncating) or reopen *filename* for parallel writing and return
+    it as an open :class:`h5py.File`.
+
+    The file access property list is built by hand so that, in addition to
+    the MPI-IO driver, metadata reads and writes are done collectively where
+    h5py supports it.  This lets HDF5 batch the many small group and
+    attribute writes made for each patch instead of issuing them
+    independently from every process.
+
+    Where available, file space is managed with paged aggregation, so that
+    raw data and metadata are allocated in aligned pages of ``_page_size``
+    bytes and small accesses do not straddle file system stripes.  Objects of
+    a stripe or more are aligned to stripe boundaries, and the MPI-IO layer
+    is given the hints in ``_mpi_hints``.
+    """
+    fcpl = h5py.h5p.create(h5py.h5p.FILE_CREATE)
+    # Paged aggregation needs HDF5 >= 1.10.1 and is not wrapped by h5py 2.x
+    if (hasattr(fcpl,'set_file_space_strategy') and
+            hasattr(h5py.h5f,'FSPACE_STRATEGY_PAGE')):
+        fcpl.set_file_space_strategy(h5py.h5f.FSPACE_STRATEGY_PAGE,True,1)
+        fcpl.set_file_space_page_size(_page_size)
+
+    info = MPI.Info.Create()
+    for (k,v) in _mpi_hints.items():
+        info.Set(k,v)
+
+    fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+    fapl.set_fapl_mpio(MPI.COMM_WORLD,info)
+    info.Free()
+    fapl.set_alignment(_stripe_size,_stripe_size)
+    # Collective metadata operations need HDF5 >= 1.10 and are not wrapped
+    # by every h5py release (e.g. not by 2.10)
+    if hasattr(fapl,'set_all_coll_metadata_ops'):
+        fapl.set_all_coll_metadata_ops(True)
+    if hasattr(fapl,'set_coll_metadata_write'):
+        fapl.set_coll_metadata_write(True)
+    fapl.set_libver_bounds(h5py.h5f.LIBVER_LATEST,h5py.h5f.LIBVER_LATEST)
+    fapl.set_fclose_degree(h5py.h5f.CLOSE_STRONG)
+
+    # The low-level API takes file names as bytes
+    if not isinstance(filename,bytes):
+        filename = filename.encode(sys.getfilesystemencoding() or 'utf-8')
+    if create:
+        fid = h5py.h5f.create(filename,h5py.h5f.ACC_TRUNC,fcpl=fcpl,
+                              fapl=fapl)
+    else:
+        fid = h5py.h5f.open(filename,h5py.h5f.ACC_RDWR,fapl=fapl)
+    return h5py.File(fid)
+
+
+def _contiguous(data,state,name,dtype):
+    r"""
+    Return *data* as a C-contiguous array of type *dtype*, the type of the
+    dataset it is written to, so that HDF5 need not convert it.
+
+    The arrays of a PetClaw state are Fortran-ordered views of PETSc vectors,
+    so they are cast into a buffer that is kept on *state* under *name* and
+    reused for later frames.  C-contiguous arrays that already have the right
+    type are returned as they are.
+    """
+    dtype = np.dtype(dtype)
+    if data.flags['C_CONTIGUOUS'] and data.dtype == dtype:
+        return data
+    buffers = state.__dict__.setdefault('_hdf5_buffers',{})
+    buf = buffers.get(name)
+    if buf is None or buf.shape != data.shape or buf.dtype != dtype:
+        buf = np.empty(data.shape,dtype=dtype)
+        buffers[name] = buf
+    buf[...] = data
+    return buf
+
+
+def _write_collective(writes):
+    r"""
+    Write the locally owned blocks of global arrays into their datasets.
+
+    *writes* is a list of ``(dset, data, dest_sel)`` tuples, where *data* is
+    C-contiguous with the type of *dset* and *dest_sel* is the selection of
+    *dset* that this process writes *data* to: None for the whole dataset, a
+    tuple of integers and slices, or, for datasets of flattened cells, a
+    dataspace (see :func:`_flat_selection`).
+    Every process must pass the datasets in the same order.  The writes are
+    issued back to back, after all groups, datasets and attributes of the file
+    have been created, so that the collective raw data transfers are not
+    interleaved with metadata operations.  They go straight to ``H5Dwrite``,
+    bypassing h5py's generic selection machinery.
+    """
+    dxpl = _collective_dxpl()
+    for (dset,data,dest_sel) in writes:
+        if isinstance(dest_sel,h5py.h5s.SpaceID):
+            fspace = dest_sel
+            data = data.reshape(data.shape[0],-1)
+        else:
+            fspace = _space(dset,dest_sel)
+        mspace = h5py.h5s.create_simple(data.shape)
+        dset.id.write(mspace,fspace,data,dxpl=dxpl)
+
+
+def _space(dset,dest_sel=None):
+    r"""
+    Return a dataspace of *dset* in which *dest_sel*, None or a tuple of
+    integers and slices with unit step, is selected.
+    """
+    space = dset.id.get_space()
+    if dest_sel is None:
+        return space
+    start = []
+    count = []
+    for (sel,n) in zip(dest_sel,dset.shape):
+        if isinstance(sel,slice):
+            (lo,hi,step) = sel.indices(n)
+            start.append(lo)
+            count.append(hi-lo)
+        else:
+            start.append(sel)
+            count.append(1)
+    if 0 in count:
+        space.select_none()
+    else:
+        space.select_hyperslab(tuple(start),tuple(count))
+    return space
+
+
+def _collective_dxpl():
+    r"""
+    Return a dataset transfer property list for collective MPI-IO.
+    """
+    dxpl = h5py.h5p.create(h5py.h5p.DATASET_XFER)
+    dxpl.set_dxpl_mpio(h5py.h5fd.MPIO_COLLECTIVE)
+    return dxpl
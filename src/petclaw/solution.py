@@ -5,3 +5,13 @@ class Solution(Solution):
     """ Parallel Solution class.
     """
     __doc__ += pyclaw.util.add_parent_doc(pyclaw.Solution)
+
+    def _hdf5_write_func(self):
+        r"""
+        Return the parallel HDF5 writer, or the serial one if h5py was built
+        without MPI support.
+        """
+        from clawpack.petclaw import io
+        if hasattr(io,'hdf5'):
+            return io.hdf5.write
+        return super(Solution,self)._hdf5_write_func()
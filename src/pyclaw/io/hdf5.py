@@ -18,6 +18,8 @@ To install either, you must also install the hdf5 library from the website:
 import os
 import logging
 
+import numpy as np
+
 from clawpack import pyclaw
 
 logger = logging.getLogger('pyclaw.io')
@@ -28,17 +30,30 @@ use_PyTables = False
 try:
     import h5py
     use_h5py = True
-except:
+except ImportError:
     try:
         import tables
         use_PyTables = True
-    except:
+    except ImportError:
         logging.critical("Could not import h5py or PyTables!")
         error_msg = ("Could not import h5py or PyTables, please install " +
             "either h5py or PyTables.  See the doc_string for more " +
             "information.")
         raise Exception(error_msg)
 
+# Optional attributes of each patch and of each of its dimensions that are
+# stored with the patch
+_patch_attrs = ('num_ghost','patch_index','level')
+_dim_attrs = ('num_cells','lower','delta','upper','units')
+
+# Cache of the stored attribute names of a dimension, keyed by its name
+_dim_attr_names = {}
+
+# Options only supported by clawpack.petclaw.io.hdf5.write, with the values
+# that match what this module writes
+_parallel_options = {'dump_dtype':'f8','aux_scaleoffset':None,
+                     'single_file':False,'single_dataset':False}
+
 
 def write(solution,frame,path,file_prefix='claw',write_aux=False,
                 options={},write_p=False):
@@ -95,9 +110,10 @@ def write(solution,frame,path,file_prefix='claw',write_aux=False,
                        'chunks':None,'shuffle':False,'fletcher32':False}
     for (k,v) in option_defaults.iteritems():
         options[k] = options.get(k,v)
+    _check_serial_options(options)
+    dataset_options = dict((k,options[k]) for k in option_defaults)
     
-    filename = os.path.join(path,'%s%s.hdf' % 
-                                (file_prefix,str(frame).zfill(4)))
+    filename = os.path.join(path,'%s%04d.hdf' % (file_prefix,frame))
     
     if use_h5py:
         with h5py.File(filename,'w') as f:
@@ -108,33 +124,19 @@ def write(solution,frame,path,file_prefix='claw',write_aux=False,
                 # Create group for this patch
                 subgroup = f.create_group('patch%s' % patch.patch_index)
 
-                # General patch properties
-                subgroup.attrs['t'] = state.t
-                subgroup.attrs['num_eqn'] = state.num_eqn
-                subgroup.attrs['num_aux'] = state.num_aux
-                for attr in ['num_ghost','patch_index','level']:
-                    if hasattr(patch,attr):
-                        if getattr(patch,attr) is not None:
-                            subgroup.attrs[attr] = getattr(patch,attr)
-
-                # Add the dimension names as a attribute
-                subgroup.attrs['dimensions'] = patch.get_dim_attribute('name')
-                # Dimension properties
-                for dim in patch.dimensions:
-                    for attr in ['num_cells','lower','delta','upper',
-                                 'units']:
-                        if hasattr(dim,attr):
-                            if getattr(dim,attr) is not None:
-                                attr_name = '%s.%s' % (dim.name,attr)
-                                subgroup.attrs[attr_name] = getattr(dim,attr)
+                # Patch and dimension properties
+                attrs = patch_attributes(state)
+                attrs['t'] = state.t
+                subgroup.attrs.update(attrs)
 
                 if write_p:
                     q = state.p
                 else:
                     q = state.q
-                subgroup.create_dataset('q',data=q,**options)
+                subgroup.create_dataset('q',data=q,**dataset_options)
                 if write_aux and state.num_aux > 0:
-                    subgroup.create_dataset('aux',data=state.aux,**options)
+                    subgroup.create_dataset('aux',data=state.aux,
+                                            **dataset_options)
         
     elif use_PyTables:
         # f = tables.openFile(filename, mode = "w", title = options['title'])
@@ -145,6 +147,55 @@ def write(solution,frame,path,file_prefix='claw',write_aux=False,
         logging.critical(err_msg)
         raise Exception(err_msg)
 
+def _check_serial_options(options):
+    r"""
+    Raise ValueError if *options* requests any of the options of the parallel
+    writer that this module does not support.
+    """
+    for (k,v) in _parallel_options.iteritems():
+        value = options.get(k,v)
+        if k == 'dump_dtype':
+            unsupported = value is not None and np.dtype(value) != np.dtype(v)
+        else:
+            unsupported = value != v
+        if unsupported:
+            raise ValueError("The HDF5 output option %s=%r is only " % (k,value)
+                + "supported by clawpack.petclaw.io.hdf5, which needs a "
+                + "parallel (MPI-enabled) build of h5py.")
+
+def patch_attributes(state):
+    r"""
+    Return a dict of the attributes describing *state* and its patch, as
+    stored with each patch group (except for the time).
+
+    :Input:
+     - *state* - (:class:`~pyclaw.state.State`) State of the patch
+    """
+    patch = state.patch
+    attrs = {'num_eqn':state.num_eqn,
+             'num_aux':state.num_aux}
+    for attr in _patch_attrs:
+        value = getattr(patch,attr,None)
+        if value is not None:
+            attrs[attr] = value
+
+    # Add the dimension names as a attribute
+    dim_names = patch.get_dim_attribute('name')
+    attrs['dimensions'] = dim_names
+    # Dimension properties
+    for (dim_name,dim) in zip(dim_names,patch.dimensions):
+        attr_names = _dim_attr_names.get(dim_name)
+        if attr_names is None:
+            attr_names = [(attr,'%s.%s' % (dim_name,attr))
+                          for attr in _dim_attrs]
+            _dim_attr_names[dim_name] = attr_names
+        for (attr,attr_name) in attr_names:
+            value = getattr(dim,attr,None)
+            if value is not None:
+                attrs[attr_name] = value
+    return attrs
+
+
 def read(solution,frame,path='./',file_prefix='claw',read_aux=True,
                 options={}):
     r"""
@@ -158,16 +209,37 @@ def read(solution,frame,path='./',file_prefix='claw',read_aux=True,
      - *file_prefix* - (string) Prefix for the file name.  ``default = 'claw'``
      - *write_aux* - (bool) Boolean controlling whether the associated 
        auxiliary array should be written out.  ``default = False``     
-     - *options* - (dict) Optional argument dictionary, not used for reading.
+     - *options* - (dict) Optional argument dictionary.  If
+       ``options['single_file']`` is True, the frame is read from the single
+       file ``<file_prefix>.hdf`` written by
+       :func:`clawpack.petclaw.io.hdf5.write` with the same option.
+
+    Files in which the data of all patches is stored in the global datasets
+    ``q_global`` and ``aux_global`` (the *single_dataset* option of
+    :func:`clawpack.petclaw.io.hdf5.write`) are detected automatically.
     """
-    filename = os.path.join(path,'%s%s.hdf' % 
-                                (file_prefix,str(frame).zfill(4)))
+    single_file = options.get('single_file',False)
+    if single_file:
+        filename = os.path.join(path,'%s.hdf' % file_prefix)
+        # Index into the leading frame axis of each dataset
+        index = int(frame)
+    else:
+        filename = os.path.join(path,'%s%04d.hdf' % (file_prefix,frame))
+        index = Ellipsis
     patches = []
 
     if use_h5py:
         with h5py.File(filename,'r') as f:
-        
+
+            # Ranges of cells of each patch in the global datasets, if any
+            offsets = {}
+            if 'offsets' in f:
+                for (patch_index,start,stop) in f['offsets'][:]:
+                    offsets[int(patch_index)] = (int(start),int(stop))
+
             for patch in f.itervalues():
+                if not isinstance(patch,h5py.Group):
+                    continue
                 # Construct each dimension
                 dimensions = []
                 dim_names = patch.attrs['dimensions']
@@ -186,18 +258,40 @@ def read(solution,frame,path='./',file_prefix='claw',read_aux=True,
 
                 pyclaw_patch = pyclaw.solution.Patch(dimensions)
 
+                if single_file:
+                    t = patch['t'][index]
+                else:
+                    t = patch.attrs['t']
+
                 # Fetch general patch properties
-                for attr in ['t','num_eqn','patch_index','level']:
+                pyclaw_patch.t = t
+                for attr in ['num_eqn','patch_index','level']:
                     setattr(pyclaw_patch,attr,patch.attrs[attr])
 
                 state = pyclaw.state.State(pyclaw_patch, \
                          patch.attrs['num_eqn'],patch.attrs['num_aux'])
-                state.t = patch.attrs['t']
-                state.q = patch['q'][:].reshape(state.q.shape,order='F')
+                state.t = t
+                # Data may have been stored in reduced precision
+                if 'q' in patch:
+                    q = np.asarray(patch['q'][index],dtype=float)
+                    state.q = q.reshape(state.q.shape,order='F')
+                else:
+                    (start,stop) = offsets[int(patch.attrs['patch_index'])]
+                    q = np.asarray(f['q_global'][:,start:stop],dtype=float)
+                    state.q = q.reshape(state.q.shape)
 
                 # Read in aux if applicable
                 if read_aux and patch.get('aux',None) is not None:
-                    state.aux = patch['aux'][:].reshape(state.aux.shape,order='F')
+                    aux_index = index
+                    if single_file:
+                        # aux may only have been written for earlier frames
+                        aux_index = min(index,patch['aux'].shape[0]-1)
+                    aux = np.asarray(patch['aux'][aux_index],dtype=float)
+                    state.aux = aux.reshape(state.aux.shape,order='F')
+                elif read_aux and 'aux_global' in f:
+                    (start,stop) = offsets[int(patch.attrs['patch_index'])]
+                    aux = np.asarray(f['aux_global'][:,start:stop],dtype=float)
+                    state.aux = aux.reshape(state.aux.shape)
 
                 solution.states.append(state)
                 patches.append(pyclaw_patch)
@@ -289,6 +289,8 @@ class Solution(object):
             if 'petsc' in form:
                 from clawpack.petclaw import io
                 write_func = io.petsc.write
+            elif form == 'hdf5':
+                write_func = self._hdf5_write_func()
             else:
                 from clawpack.pyclaw import io
                 write_func = getattr(getattr(io,form),'write')
@@ -304,7 +306,14 @@ class Solution(object):
             msg = "Wrote out solution in format %s for time t=%s" % (form,self.t)
             logging.getLogger('pyclaw.io').info(msg)
 
-        
+
+    def _hdf5_write_func(self):
+        r"""
+        Return the function used to write this solution in HDF5 format.
+        """
+        from clawpack.pyclaw import io
+        return io.hdf5.write
+
     def read(self, frame, path='./_output', file_format='ascii', 
                           file_prefix=None, read_aux=True, options={}, **kargs):
         r"""
@@ -1,7 +1,10 @@
 import os
+import shutil
+import tempfile
 from clawpack import pyclaw
 from clawpack.pyclaw import examples
 import numpy as np
+import h5py
 
 thisdir = os.path.dirname(__file__)
 file_formats = ['hdf5','ascii']
@@ -20,6 +23,129 @@ def test_io_from_hdf5_with_aux():
     read_write_and_compare(file_formats,regression_dir,'hdf5',0,aux=True)
 
 
+def test_read_hdf5_reduced_precision():
+    # q stored as f4 is read back as float64
+    path = tempfile.mkdtemp()
+    try:
+        q = hdf5_test_data(2,(4,3))
+        aux = hdf5_test_data(1,(4,3),offset=10.)
+        with h5py.File(os.path.join(path,'claw0003.hdf'),'w') as f:
+            patch = hdf5_test_patch(f,1,(4,3),2,1)
+            patch.attrs['t'] = 0.5
+            patch.create_dataset('q',data=q,dtype='f4')
+            patch.create_dataset('aux',data=aux)
+
+        sol = pyclaw.Solution()
+        sol.read(3,path=path,file_format='hdf5',read_aux=True)
+        state = sol.states[0]
+        assert state.q.dtype == np.float64
+        assert np.all(state.q == q.astype('f4').astype(float))
+        assert np.all(state.aux == aux)
+        assert state.t == 0.5
+    finally:
+        shutil.rmtree(path)
+
+def test_read_hdf5_single_file():
+    # All frames in one file; aux only written with the first frame
+    path = tempfile.mkdtemp()
+    try:
+        times = [0.,0.5,1.]
+        q = [hdf5_test_data(2,(4,3),offset=i) for i in range(len(times))]
+        aux = hdf5_test_data(1,(4,3),offset=10.)
+        with h5py.File(os.path.join(path,'claw.hdf'),'w') as f:
+            patch = hdf5_test_patch(f,1,(4,3),2,1)
+            patch.create_dataset('t',data=times)
+            patch.create_dataset('q',data=np.array(q))
+            patch.create_dataset('aux',data=aux[np.newaxis])
+
+        sol = pyclaw.Solution()
+        sol.read(2,path=path,file_format='hdf5',read_aux=True,
+                 options={'single_file':True})
+        state = sol.states[0]
+        assert state.t == times[2]
+        assert np.all(state.q == q[2])
+        assert np.all(state.aux == aux)
+    finally:
+        shutil.rmtree(path)
+
+def test_write_hdf5_rejects_parallel_options():
+    # Options of the parallel writer that the serial writer cannot honour
+    regression_dir = os.path.join(thisdir,'./test_data/advection_2d_with_aux')
+    sol = pyclaw.Solution()
+    sol.read(0,path=regression_dir,file_format='hdf5')
+    path = tempfile.mkdtemp()
+    try:
+        for options in ({'single_file':True},{'single_dataset':True},
+                        {'dump_dtype':'f4'},{'aux_scaleoffset':3}):
+            try:
+                sol.write(0,path=path,file_format='hdf5',write_aux=True,
+                          options=options)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("%s not rejected" % options)
+        # Values matching the serial layout are accepted
+        sol.write(0,path=path,file_format='hdf5',write_aux=True,
+                  options={'single_file':False,'dump_dtype':'f8'})
+        assert os.path.exists(os.path.join(path,'claw0000.hdf'))
+    finally:
+        shutil.rmtree(path)
+
+def test_read_hdf5_single_dataset():
+    # Data of all patches in root datasets, next to the patch groups
+    path = tempfile.mkdtemp()
+    try:
+        shapes = {1:(4,3),2:(2,5)}
+        q = dict((i,hdf5_test_data(2,shape,offset=i))
+                 for (i,shape) in shapes.items())
+        aux = dict((i,hdf5_test_data(1,shape,offset=10.*i))
+                   for (i,shape) in shapes.items())
+        offsets = [(1,0,12),(2,12,22)]
+        with h5py.File(os.path.join(path,'claw0000.hdf'),'w') as f:
+            for (i,shape) in shapes.items():
+                patch = hdf5_test_patch(f,i,shape,2,1)
+                patch.attrs['t'] = 0.25
+            f.create_dataset('q_global',data=np.hstack(
+                [q[i].reshape(2,-1) for (i,start,stop) in offsets]))
+            f.create_dataset('aux_global',data=np.hstack(
+                [aux[i].reshape(1,-1) for (i,start,stop) in offsets]))
+            f.create_dataset('offsets',data=np.array(offsets,dtype='int64'))
+
+        sol = pyclaw.Solution()
+        sol.read(0,path=path,file_format='hdf5',read_aux=True)
+        assert len(sol.states) == 2
+        for state in sol.states:
+            i = state.patch.patch_index
+            assert state.q.shape == (2,) + shapes[i]
+            assert np.all(state.q == q[i])
+            assert np.all(state.aux == aux[i])
+            assert state.t == 0.25
+    finally:
+        shutil.rmtree(path)
+
+
+def hdf5_test_data(num_fields,shape,offset=0.):
+    r"""Return an array of *num_fields* fields on a patch of *shape*, with
+    values that are not exactly representable in single precision."""
+    n = num_fields*int(np.prod(shape))
+    return (offset + 0.1*np.arange(n)).reshape((num_fields,)+shape)
+
+def hdf5_test_patch(f,patch_index,shape,num_eqn,num_aux):
+    r"""Create the group of a patch on the unit square in HDF5 file *f*,
+    with the attributes written by pyclaw.io.hdf5.write."""
+    patch = f.create_group('patch%s' % patch_index)
+    names = ['x','y','z'][:len(shape)]
+    patch.attrs['dimensions'] = names
+    for (name,n) in zip(names,shape):
+        patch.attrs['%s.lower' % name] = 0.
+        patch.attrs['%s.upper' % name] = 1.
+        patch.attrs['%s.num_cells' % name] = n
+    patch.attrs['num_eqn'] = num_eqn
+    patch.attrs['num_aux'] = num_aux
+    patch.attrs['patch_index'] = patch_index
+    patch.attrs['level'] = 1
+    return patch
+
 
 def read_write_and_compare(file_formats,regression_dir,regression_format,frame_num,aux=False):
     r"""Test IO file formats:
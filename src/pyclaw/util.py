@@ -688,6 +688,11 @@ class FrameCounter:
     def __repr__(self):
         return str(self.__frame)
 
+    def __int__(self):
+        return self.__frame
+
+    __index__ = __int__
+
     def increment(self):
         r"""
         Increment the counter by one